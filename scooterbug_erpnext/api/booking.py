@@ -1,41 +1,47 @@
 import frappe
 from frappe import _
+from frappe.utils import date_diff, now_datetime
+from scooterbug_erpnext.scooterbug.doctype.equipment.equipment import get_equipment_rates
+
+# Equipment (from_status, status) implied by a booking status, for the background status sync
+BOOKING_EQUIPMENT_STATUS = {
+    "Confirmed": ("Available", "Reserved"),
+    "Cancelled": ("Reserved", "Available")
+}
 
 @frappe.whitelist()
 def get_available_equipment(location, start_date, end_date, equipment_type=None):
     """Get available equipment for a given location and date range"""
-    filters = {
+    conditions = ""
+    values = {
         "location": location,
-        "status": "Available",
-        "is_available": 1
+        "start_date": start_date,
+        "end_date": end_date,
+        "equipment_type": equipment_type
     }
     
     if equipment_type:
-        filters["equipment_type"] = equipment_type
-    
-    # Get all equipment at location
-    equipment_list = frappe.get_all(
-        "Equipment",
-        filters=filters,
-        fields=["*"]
-    )
-    
-    # Filter out equipment that has bookings during the requested period
-    available = []
-    for eq in equipment_list:
-        # Check for conflicting bookings
-        conflicts = frappe.db.sql("""
-            SELECT eb.name 
+        conditions = "AND e.equipment_type = %(equipment_type)s"
+    
+    # Get equipment at location, excluding any with bookings during the requested period
+    available = frappe.db.sql(f"""
+        SELECT e.*
+        FROM `tabEquipment` e
+        WHERE e.location = %(location)s
+        AND e.status = 'Available'
+        AND e.is_available = 1
+        {conditions}
+        AND NOT EXISTS (
+            SELECT 1
             FROM `tabEquipment Booking` eb
             JOIN `tabBooking Item` bi ON bi.parent = eb.name
-            WHERE bi.equipment = %s
+            WHERE bi.equipment = e.name
             AND eb.booking_status NOT IN ('Cancelled', 'Completed')
-            AND eb.rental_start_date <= %s
-            AND eb.rental_end_date >= %s
-        """, (eq.name, end_date, start_date))
-        
-        if not conflicts:
-            available.append(eq)
+            AND eb.rental_start_date <= %(end_date)s
+            AND eb.rental_end_date >= %(start_date)s
+        )
+        ORDER BY e.modified DESC
+    """, values, as_dict=True)
     
     return available
 
@@ -46,10 +52,7 @@ def create_booking(customer, location, start_date, end_date, delivery_date, deli
     """Create a new equipment booking"""
     
     # Calculate rental days
-    from datetime import datetime
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    rental_days = (end - start).days + 1
+    rental_days = date_diff(end_date, start_date) + 1
     
     # Create booking document
     booking = frappe.get_doc({
@@ -75,9 +78,15 @@ def create_booking(customer, location, start_date, end_date, delivery_date, deli
     equipment_total = 0
     damage_waiver_total = 0
     
+    # Fetch rates for all referenced equipment at once
+    equipment_ids = [item.get("equipment") for item in items if item.get("item_type") == "Equipment"]
+    equipment_map = get_equipment_rates(equipment_ids)
+    
     for item in items:
         if item.get("item_type") == "Equipment":
-            eq = frappe.get_doc("Equipment", item.get("equipment"))
+            eq = equipment_map.get(item.get("equipment"))
+            if not eq:
+                frappe.throw(_("Equipment {0} not found").format(item.get("equipment")), frappe.DoesNotExistError)
             daily_rate = eq.daily_rate
             dw_rate = eq.damage_waiver_rate if damage_waiver else 0
             subtotal = daily_rate * rental_days
@@ -118,18 +127,14 @@ def confirm_booking(booking_id, payment_reference=None):
     if booking.booking_status != "Draft":
         frappe.throw(_("Booking is not in Draft status"))
     
-    # Update equipment status to Reserved
-    for item in booking.items:
-        if item.item_type == "Equipment" and item.equipment:
-            eq = frappe.get_doc("Equipment", item.equipment)
-            eq.status = "Reserved"
-            eq.save(ignore_permissions=True)
-    
     booking.booking_status = "Confirmed"
     booking.payment_status = "Paid"
     booking.payment_reference = payment_reference
     booking.save(ignore_permissions=True)
     
+    # Update equipment status to Reserved
+    enqueue_equipment_status(booking)
+    
     return {"status": "success", "booking_id": booking_id}
 
 @frappe.whitelist()
@@ -140,33 +145,70 @@ def cancel_booking(booking_id, reason=None):
     if booking.booking_status in ["Completed", "Cancelled"]:
         frappe.throw(_("Booking cannot be cancelled"))
     
-    # Release equipment
-    for item in booking.items:
-        if item.item_type == "Equipment" and item.equipment:
-            eq = frappe.get_doc("Equipment", item.equipment)
-            eq.status = "Available"
-            eq.save(ignore_permissions=True)
-    
     booking.booking_status = "Cancelled"
     booking.internal_notes = f"Cancelled: {reason}" if reason else "Cancelled by user"
     booking.save(ignore_permissions=True)
     
+    # Release equipment
+    enqueue_equipment_status(booking)
+    
     return {"status": "success", "booking_id": booking_id}
 
 def on_booking_submit(doc, method):
     """Called when booking is submitted"""
     # Update equipment status
-    for item in doc.items:
-        if item.item_type == "Equipment" and item.equipment:
-            eq = frappe.get_doc("Equipment", item.equipment)
-            eq.status = "Reserved"
-            eq.save(ignore_permissions=True)
+    set_equipment_status(get_booking_equipment(doc), "Reserved")
 
 def on_booking_cancel(doc, method):
     """Called when booking is cancelled"""
     # Release equipment
-    for item in doc.items:
-        if item.item_type == "Equipment" and item.equipment:
-            eq = frappe.get_doc("Equipment", item.equipment)
-            eq.status = "Available"
-            eq.save(ignore_permissions=True)
+    set_equipment_status(get_booking_equipment(doc), "Available")
+
+def get_booking_equipment(booking):
+    """Get the equipment IDs linked to a booking's items"""
+    return [item.equipment for item in booking.items if item.item_type == "Equipment" and item.equipment]
+
+def set_equipment_status(equipment_ids, status, from_status=None):
+    """
+    Update the status of several equipment records in a single query
+    - from_status: only update equipment currently in this status
+    """
+    if not equipment_ids:
+        return
+    
+    condition = "AND status = %(from_status)s" if from_status else ""
+    frappe.db.sql(f"""
+        UPDATE `tabEquipment`
+        SET status = %(status)s, modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(equipment)s {condition}
+    """, {
+        "status": status,
+        "from_status": from_status,
+        "modified": now_datetime(),
+        "user": frappe.session.user,
+        "equipment": equipment_ids
+    })
+
+def enqueue_equipment_status(booking):
+    """Sync the booking's equipment status in a background job once the current transaction commits"""
+    if not get_booking_equipment(booking):
+        return
+    
+    frappe.enqueue(
+        "scooterbug_erpnext.api.booking.sync_booking_equipment_status",
+        queue="short",
+        enqueue_after_commit=True,
+        booking_id=booking.name
+    )
+
+def sync_booking_equipment_status(booking_id):
+    """Set equipment status from the booking's current status, skipping bookings that have moved on"""
+    booking = frappe.get_doc("Equipment Booking", booking_id)
+    
+    # Jobs may run late or out of order, so the status is derived when the job runs and
+    # only equipment still in the expected status is touched, leaving rows another
+    # booking has since reserved or rented alone
+    transition = BOOKING_EQUIPMENT_STATUS.get(booking.booking_status)
+    if transition:
+        from_status, status = transition
+        set_equipment_status(get_booking_equipment(booking), status, from_status)
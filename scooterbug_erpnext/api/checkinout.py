@@ -1,38 +1,33 @@
 import frappe
 from frappe import _
-from frappe.utils import now_datetime
+from frappe.model.naming import make_autoname
+from frappe.utils import cint, now_datetime, today
+
+LOG_NAMING_SERIES = "CIO-.YYYY.-.#####"
+PENDING_CACHE_PREFIX = "scooterbug_pending_"
+PENDING_CACHE_TTL = 60
+PENDING_CACHE_KINDS = ("check_ins", "check_outs", "check_ins_count", "check_outs_count")
+LOG_FIELDS = [
+    "log_type", "booking", "equipment", "timestamp", "processed_by", "location", "customer_name",
+    "equipment_condition", "battery_level", "condition_notes", "damage_reported", "damage_description"
+]
 
 @frappe.whitelist()
 def process_check_out(booking_id, equipment_id, battery_level=100, condition="Good", notes=None):
     """Process equipment check-out to customer"""
-    booking = frappe.get_doc("Equipment Booking", booking_id)
-    equipment = frappe.get_doc("Equipment", equipment_id)
+    booking = get_booking(booking_id, ["location", "customer_name", "booking_status"])
     
     # Create check-out log
     log = frappe.get_doc({
         "doctype": "Check In Out Log",
-        "log_type": "Check-Out",
-        "booking": booking_id,
-        "equipment": equipment_id,
-        "timestamp": now_datetime(),
-        "processed_by": frappe.session.user,
-        "location": booking.location,
-        "customer_name": booking.customer_name,
-        "equipment_condition": condition,
-        "battery_level": battery_level,
-        "condition_notes": notes
+        **make_log_row("Check-Out", booking_id, booking, equipment_id, condition, battery_level, notes)
     })
+    # Equipment status is updated by the after_insert hook
     log.insert(ignore_permissions=True)
     
-    # Update equipment status
-    equipment.status = "Rented"
-    equipment.current_battery_level = battery_level
-    equipment.save(ignore_permissions=True)
-    
     # Update booking status
     if booking.booking_status == "Confirmed":
-        booking.booking_status = "In Progress"
-        booking.save(ignore_permissions=True)
+        set_booking_status(booking_id, "In Progress", booking.location)
     
     return {
         "status": "success",
@@ -44,73 +39,237 @@ def process_check_out(booking_id, equipment_id, battery_level=100, condition="Go
 def process_check_in(booking_id, equipment_id, battery_level=None, condition="Good", 
                      damage_reported=False, damage_description=None, notes=None):
     """Process equipment check-in from customer"""
-    booking = frappe.get_doc("Equipment Booking", booking_id)
-    equipment = frappe.get_doc("Equipment", equipment_id)
+    damage_reported = cint(damage_reported)
+    booking = get_booking(booking_id, ["location", "customer_name"])
     
     # Create check-in log
     log = frappe.get_doc({
         "doctype": "Check In Out Log",
-        "log_type": "Check-In",
-        "booking": booking_id,
-        "equipment": equipment_id,
-        "timestamp": now_datetime(),
-        "processed_by": frappe.session.user,
-        "location": booking.location,
-        "customer_name": booking.customer_name,
-        "equipment_condition": condition,
-        "battery_level": battery_level,
-        "condition_notes": notes,
-        "damage_reported": damage_reported,
-        "damage_description": damage_description
+        **make_log_row("Check-In", booking_id, booking, equipment_id, condition, battery_level, notes,
+                       damage_reported, damage_description)
     })
+    # Equipment status is updated by the after_insert hook
     log.insert(ignore_permissions=True)
     
-    # Update equipment status
-    if damage_reported or condition in ["Poor", "Damaged"]:
-        equipment.status = "Maintenance"
-        equipment.condition_notes = damage_description or notes
+    # Create maintenance task if damaged
+    if damage_reported:
+        create_maintenance_task(equipment_id, booking.location, damage_description)
+    
+    # Check if all items returned
+    all_returned = check_all_items_returned(booking_id)
+    if all_returned:
+        set_booking_status(booking_id, "Completed", booking.location)
+    
+    return {
+        "status": "success",
+        "log_id": log.name,
+        "message": f"Equipment {equipment_id} checked in successfully",
+        "booking_completed": all_returned
+    }
+
+@frappe.whitelist()
+def process_check_out_bulk(booking_id, items):
+    """
+    Process check-out of several equipment items for one booking in a single batch
+    - items: list of dicts with equipment, battery_level, condition and notes
+    """
+    items = parse_bulk_items(items)
+    
+    booking = get_booking(booking_id, ["location", "customer_name", "booking_status"])
+    
+    validate_equipment_exists([item["equipment"] for item in items])
+    
+    rows = []
+    equipment_updates = {}
+    for item in items:
+        row = make_log_row("Check-Out", booking_id, booking, item["equipment"],
+                           item.get("condition", "Good"), item.get("battery_level", 100), item.get("notes"))
+        rows.append(row)
+        equipment_updates[item["equipment"]] = get_equipment_update(row)
+    
+    insert_logs(rows)
+    update_equipment_bulk(equipment_updates)
+    
+    # Update booking status
+    if booking.booking_status == "Confirmed":
+        set_booking_status(booking_id, "In Progress", booking.location)
+    
+    return {
+        "status": "success",
+        "log_ids": [row["name"] for row in rows],
+        "message": f"{len(rows)} equipment items checked out successfully"
+    }
+
+@frappe.whitelist()
+def process_check_in_bulk(booking_id, items):
+    """
+    Process check-in of several equipment items for one booking in a single batch
+    - items: list of dicts with equipment, battery_level, condition, damage_reported,
+      damage_description and notes
+    """
+    items = parse_bulk_items(items)
+    
+    booking = get_booking(booking_id, ["location", "customer_name", "rental_days"])
+    
+    validate_equipment_exists([item["equipment"] for item in items])
+    
+    rows = []
+    equipment_updates = {}
+    rental_days = {}
+    for item in items:
+        equipment_id = item["equipment"]
+        damage_reported = cint(item.get("damage_reported"))
+        row = make_log_row("Check-In", booking_id, booking, equipment_id, item.get("condition", "Good"),
+                           item.get("battery_level"), item.get("notes"), damage_reported,
+                           item.get("damage_description"))
+        rows.append(row)
+        
+        # Update equipment status, adding the booking's rental days once per log
+        equipment_updates[equipment_id] = get_equipment_update(row)
+        rental_days[equipment_id] = rental_days.get(equipment_id, 0) + (booking.rental_days or 0)
         
         # Create maintenance task if damaged
         if damage_reported:
-            create_maintenance_task(equipment_id, booking.location, damage_description)
-    else:
-        equipment.status = "Available"
-    
-    if battery_level is not None:
-        equipment.current_battery_level = battery_level
+            create_maintenance_task(equipment_id, booking.location, row["damage_description"])
     
-    equipment.total_rental_days = (equipment.total_rental_days or 0) + booking.rental_days
-    equipment.save(ignore_permissions=True)
+    insert_logs(rows)
+    update_equipment_bulk(equipment_updates, {"total_rental_days": rental_days})
     
     # Check if all items returned
     all_returned = check_all_items_returned(booking_id)
     if all_returned:
-        booking.booking_status = "Completed"
-        booking.save(ignore_permissions=True)
+        set_booking_status(booking_id, "Completed", booking.location)
     
     return {
         "status": "success",
-        "log_id": log.name,
-        "message": f"Equipment {equipment_id} checked in successfully",
+        "log_ids": [row["name"] for row in rows],
+        "message": f"{len(rows)} equipment items checked in successfully",
         "booking_completed": all_returned
     }
 
+def parse_bulk_items(items):
+    """Parse a bulk items payload, raising unless it is a non-empty list of dicts with equipment"""
+    items = frappe.parse_json(items)
+    if not items:
+        frappe.throw(_("No items to process"))
+    
+    if not isinstance(items, list) or not all(isinstance(item, dict) and item.get("equipment") for item in items):
+        frappe.throw(_("Each item must include an equipment"))
+    
+    return items
+
+def get_booking(booking_id, fields):
+    """Get the given Equipment Booking fields as a dict, raising if the booking does not exist"""
+    booking = frappe.db.get_value("Equipment Booking", booking_id, fields, as_dict=True)
+    if not booking:
+        frappe.throw(_("Equipment Booking {0} not found").format(booking_id), frappe.DoesNotExistError)
+    return booking
+
+def set_booking_status(booking_id, status, location):
+    """Set the booking status and drop the cached pending check-in/out lists for its location"""
+    frappe.db.set_value("Equipment Booking", booking_id, "booking_status", status)
+    clear_pending_cache(locations=[location])
+
+def make_log_row(log_type, booking_id, booking, equipment_id, condition, battery_level, notes,
+                 damage_reported=0, damage_description=None):
+    """Build the Check In Out Log field values shared by the single-item and bulk paths"""
+    return {
+        "log_type": log_type,
+        "booking": booking_id,
+        "equipment": equipment_id,
+        "timestamp": now_datetime(),
+        "processed_by": frappe.session.user,
+        "location": booking.location,
+        "customer_name": booking.customer_name,
+        "equipment_condition": condition,
+        "battery_level": battery_level,
+        "condition_notes": notes,
+        "damage_reported": damage_reported,
+        "damage_description": damage_description
+    }
+
+def insert_logs(rows):
+    """Insert Check In Out Log rows with one multi-row INSERT, skipping per-document hooks"""
+    now = now_datetime()
+    user = frappe.session.user
+    
+    values = []
+    for row in rows:
+        row["name"] = make_autoname(LOG_NAMING_SERIES, "Check In Out Log")
+        values.append((row["name"], user, now, now, user, *(row[field] for field in LOG_FIELDS)))
+    
+    frappe.db.bulk_insert(
+        "Check In Out Log",
+        ["name", "owner", "creation", "modified", "modified_by", *LOG_FIELDS],
+        values
+    )
+
+def validate_equipment_exists(equipment_ids):
+    """Raise if any of the given equipment does not exist"""
+    found = frappe.get_all("Equipment", filters={"name": ["in", equipment_ids]}, pluck="name")
+    
+    missing = set(equipment_ids) - set(found)
+    if missing:
+        frappe.throw(_("Equipment {0} not found").format(", ".join(sorted(missing))), frappe.DoesNotExistError)
+
+def update_equipment_bulk(updates, increments=None):
+    """
+    Write per-equipment field values with a single UPDATE using CASE expressions
+    - increments: optional {field: {equipment: amount}} added to the stored value in SQL
+    """
+    if not updates:
+        return
+    
+    values = {"names": list(updates), "modified": now_datetime(), "user": frappe.session.user}
+    names = {}
+    for i, name in enumerate(updates):
+        names[name] = f"n{i}"
+        values[f"n{i}"] = name
+    
+    assignments = []
+    for field in sorted({field for update in updates.values() for field in update}):
+        cases = []
+        for name, update in updates.items():
+            if field in update:
+                key = f"{field}_{names[name]}"
+                values[key] = update[field]
+                cases.append(f"WHEN %({names[name]})s THEN %({key})s")
+        assignments.append(f"`{field}` = CASE name {' '.join(cases)} ELSE `{field}` END")
+    
+    for field, amounts in sorted((increments or {}).items()):
+        cases = []
+        for name, amount in amounts.items():
+            key = f"{field}_{names[name]}"
+            values[key] = amount
+            cases.append(f"WHEN %({names[name]})s THEN %({key})s")
+        assignments.append(f"`{field}` = IFNULL(`{field}`, 0) + CASE name {' '.join(cases)} ELSE 0 END")
+    
+    frappe.db.sql(f"""
+        UPDATE `tabEquipment`
+        SET {', '.join(assignments)}, modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+    """, values)
+
 def check_all_items_returned(booking_id):
     """Check if all equipment items have been returned"""
-    booking = frappe.get_doc("Equipment Booking", booking_id)
+    # Count equipment items on the booking without a check-in log
+    outstanding = frappe.db.sql("""
+        SELECT COUNT(*)
+        FROM `tabBooking Item` bi
+        WHERE bi.parent = %(booking)s
+        AND bi.parenttype = 'Equipment Booking'
+        AND bi.item_type = 'Equipment'
+        AND IFNULL(bi.equipment, '') != ''
+        AND NOT EXISTS (
+            SELECT 1
+            FROM `tabCheck In Out Log` cio
+            WHERE cio.booking = bi.parent
+            AND cio.equipment = bi.equipment
+            AND cio.log_type = 'Check-In'
+        )
+    """, {"booking": booking_id})[0][0]
     
-    for item in booking.items:
-        if item.item_type == "Equipment" and item.equipment:
-            # Check for check-in log
-            check_in = frappe.db.exists("Check In Out Log", {
-                "booking": booking_id,
-                "equipment": item.equipment,
-                "log_type": "Check-In"
-            })
-            if not check_in:
-                return False
-    
-    return True
+    return not outstanding
 
 def create_maintenance_task(equipment_id, location, description):
     """Create a maintenance task for damaged equipment"""
@@ -128,44 +287,102 @@ def create_maintenance_task(equipment_id, location, description):
 
 def update_equipment_status(doc, method):
     """Update equipment status after check-in/out log is created"""
-    equipment = frappe.get_doc("Equipment", doc.equipment)
+    update = get_equipment_update(doc)
+    assignments = [f"`{field}` = %({field})s" for field in update]
+    
+    # Add the booking's rental days in the same statement on check-in
+    if doc.log_type == "Check-In":
+        assignments.append("""total_rental_days = IFNULL(total_rental_days, 0) + IFNULL((
+            SELECT rental_days FROM `tabEquipment Booking` WHERE name = %(booking)s
+        ), 0)""")
+    
+    frappe.db.sql(f"""
+        UPDATE `tabEquipment`
+        SET {', '.join(assignments)}, modified = %(modified)s, modified_by = %(user)s
+        WHERE name = %(equipment)s
+    """, {
+        **update,
+        "booking": doc.booking,
+        "equipment": doc.equipment,
+        "modified": now_datetime(),
+        "user": frappe.session.user
+    })
+
+def get_equipment_update(log):
+    """Get the Equipment field values implied by a check-in/out log (document or row dict)"""
+    update = {}
+    
+    if log.get("log_type") == "Check-Out":
+        update["status"] = "Rented"
+    elif log.get("damage_reported") or log.get("equipment_condition") in ["Poor", "Damaged"]:
+        update["status"] = "Maintenance"
+        update["condition_notes"] = log.get("damage_description") or log.get("condition_notes")
+    else:
+        update["status"] = "Available"
     
-    if doc.log_type == "Check-Out":
-        equipment.status = "Rented"
-    elif doc.log_type == "Check-In":
-        if doc.damage_reported:
-            equipment.status = "Maintenance"
-        else:
-            equipment.status = "Available"
+    if log.get("battery_level") is not None:
+        update["current_battery_level"] = log.get("battery_level")
     
-    equipment.save(ignore_permissions=True)
+    return update
 
 @frappe.whitelist()
 def get_pending_check_ins(location=None):
     """Get bookings with pending check-ins for today"""
-    from frappe.utils import today
-    
-    filters = {
-        "booking_status": "In Progress",
-        "pickup_date": today()
-    }
-    
-    if location:
-        filters["location"] = location
+    cache_key = get_pending_cache_key("check_ins", location)
+    bookings = frappe.cache().get_value(cache_key)
+    if bookings is not None:
+        return bookings
     
     bookings = frappe.get_all(
         "Equipment Booking",
-        filters=filters,
+        filters=get_pending_check_in_filters(location),
         fields=["name", "customer_name", "pickup_time", "location"]
     )
     
+    frappe.cache().set_value(cache_key, bookings, expires_in_sec=PENDING_CACHE_TTL)
     return bookings
 
 @frappe.whitelist()
 def get_pending_check_outs(location=None):
     """Get bookings with pending check-outs for today"""
-    from frappe.utils import today
+    cache_key = get_pending_cache_key("check_outs", location)
+    bookings = frappe.cache().get_value(cache_key)
+    if bookings is not None:
+        return bookings
+    
+    bookings = frappe.get_all(
+        "Equipment Booking",
+        filters=get_pending_check_out_filters(location),
+        fields=["name", "customer_name", "delivery_time", "location", "delivery_address"]
+    )
+    
+    frappe.cache().set_value(cache_key, bookings, expires_in_sec=PENDING_CACHE_TTL)
+    return bookings
+
+@frappe.whitelist()
+def get_pending_check_ins_count(location=None):
+    """Get the number of bookings with pending check-ins for today"""
+    return get_pending_count("check_ins", get_pending_check_in_filters(location), location)
+
+@frappe.whitelist()
+def get_pending_check_outs_count(location=None):
+    """Get the number of bookings with pending check-outs for today"""
+    return get_pending_count("check_outs", get_pending_check_out_filters(location), location)
+
+def get_pending_check_in_filters(location=None):
+    """Get Equipment Booking filters for today's pending check-ins"""
+    filters = {
+        "booking_status": "In Progress",
+        "pickup_date": today()
+    }
+    
+    if location:
+        filters["location"] = location
     
+    return filters
+
+def get_pending_check_out_filters(location=None):
+    """Get Equipment Booking filters for today's pending check-outs"""
     filters = {
         "booking_status": "Confirmed",
         "delivery_date": today()
@@ -174,10 +391,39 @@ def get_pending_check_outs(location=None):
     if location:
         filters["location"] = location
     
-    bookings = frappe.get_all(
-        "Equipment Booking",
-        filters=filters,
-        fields=["name", "customer_name", "delivery_time", "location", "delivery_address"]
-    )
+    return filters
+
+def get_pending_count(kind, filters, location=None):
+    """Count pending bookings, cached alongside the pending lists"""
+    cache_key = get_pending_cache_key(f"{kind}_count", location)
+    count = frappe.cache().get_value(cache_key)
+    if count is not None:
+        return count
     
-    return bookings
+    count = frappe.db.count("Equipment Booking", filters)
+    frappe.cache().set_value(cache_key, count, expires_in_sec=PENDING_CACHE_TTL)
+    return count
+
+def get_pending_cache_key(kind, location=None):
+    """Get the cache key for today's pending list or count of the given kind and location"""
+    return f"{PENDING_CACHE_PREFIX}{kind}:{today()}:{location or ''}"
+
+def clear_pending_cache(doc=None, method=None, locations=None):
+    """
+    Drop today's cached pending check-in/out lists and counts for the given locations
+    and for the all-locations view (also used as an Equipment Booking doc event)
+    """
+    locations = set(locations or [])
+    if doc:
+        locations.add(doc.location)
+        # A booking moved to another location also changes the old location's lists
+        before = doc.get_doc_before_save()
+        if before:
+            locations.add(before.location)
+    
+    # Delete exact keys rather than scanning Redis for the prefix
+    frappe.cache().delete_value([
+        get_pending_cache_key(kind, location)
+        for kind in PENDING_CACHE_KINDS
+        for location in {location or "" for location in locations} | {""}
+    ])
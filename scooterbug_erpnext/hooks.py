@@ -37,6 +37,7 @@ doc_events = {
     "Equipment Booking": {
         "on_submit": "scooterbug_erpnext.api.booking.on_booking_submit",
         "on_cancel": "scooterbug_erpnext.api.booking.on_booking_cancel",
+        "on_change": "scooterbug_erpnext.api.checkinout.clear_pending_cache",
     },
     "Check In Out Log": {
         "after_insert": "scooterbug_erpnext.api.checkinout.update_equipment_status",
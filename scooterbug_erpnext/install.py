@@ -1,4 +1,5 @@
 import frappe
+from frappe.utils import now_datetime
 
 def after_install():
     """Setup initial data after app installation"""
@@ -66,17 +67,11 @@ def create_locations():
         }
     ]
     
-    for loc in locations:
-        try:
-            if not frappe.db.exists("ScooterBug Location", loc["location_code"]):
-                doc = frappe.get_doc({
-                    "doctype": "ScooterBug Location",
-                    **loc
-                })
-                doc.insert(ignore_permissions=True)
-                print(f"Created location: {loc['location_name']}")
-        except Exception as e:
-            print(f"Could not create location {loc['location_name']}: {e}")
+    try:
+        for loc in bulk_insert_records("ScooterBug Location", locations, "location_code"):
+            print(f"Created location: {loc['location_name']}")
+    except Exception as e:
+        print(f"Could not create locations: {e}")
 
 def create_sample_equipment_types():
     """Create sample equipment for demonstration"""
@@ -161,19 +156,48 @@ def create_sample_equipment_types():
         }
     ]
     
-    for eq in equipment_list:
-        try:
-            if not frappe.db.exists("Equipment", eq["equipment_id"]):
-                doc = frappe.get_doc({
-                    "doctype": "Equipment",
-                    **eq
-                })
-                doc.insert(ignore_permissions=True)
-                print(f"Created equipment: {eq['equipment_name']}")
-        except Exception as e:
-            print(f"Could not create equipment {eq['equipment_name']}: {e}")
+    try:
+        for eq in bulk_insert_records("Equipment", equipment_list, "equipment_id"):
+            print(f"Created equipment: {eq['equipment_name']}")
+    except Exception as e:
+        print(f"Could not create equipment: {e}")
     
     try:
         frappe.db.commit()
     except Exception:
         pass
+
+def bulk_insert_records(doctype, records, name_field):
+    """
+    Insert seed records that do not exist yet with a single multi-row INSERT
+    - Records are named by name_field, matching the doctype's autoname
+    - Returns the records that were inserted
+    """
+    existing = set(frappe.get_all(
+        doctype,
+        filters={"name": ["in", [record[name_field] for record in records]]},
+        pluck="name"
+    ))
+    records = [record for record in records if record[name_field] not in existing]
+    if not records:
+        return []
+    
+    now = now_datetime()
+    rows = []
+    for record in records:
+        # new_doc applies doctype defaults; get_valid_dict fills numeric columns
+        doc = frappe.new_doc(doctype)
+        doc.update(record)
+        doc.update({
+            "name": record[name_field],
+            "owner": frappe.session.user,
+            "modified_by": frappe.session.user,
+            "creation": now,
+            "modified": now
+        })
+        rows.append(doc.get_valid_dict(convert_dates_to_str=True))
+    
+    fields = list(rows[0])
+    frappe.db.bulk_insert(doctype, fields, [[row.get(field) for field in fields] for row in rows])
+    
+    return records
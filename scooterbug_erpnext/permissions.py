@@ -3,6 +3,21 @@ Custom permission handlers for ScooterBug ERPNext
 """
 import frappe
 
+ADMIN_ROLES = frozenset(["System Manager", "ScooterBug Admin", "Administrator"])
+MANAGER_ROLES = frozenset(["System Manager", "Administrator"])
+STAFF_ROLES = frozenset(["ScooterBug Admin", "ScooterBug Staff"])
+
+def get_user_roles(user):
+    """Get a user's roles, cached on frappe.local for the rest of the request"""
+    cache = getattr(frappe.local, "scooterbug_user_roles", None)
+    if cache is None:
+        cache = frappe.local.scooterbug_user_roles = {}
+    
+    if user not in cache:
+        cache[user] = frozenset(frappe.get_roles(user))
+    
+    return cache[user]
+
 def equipment_permission(doc, user=None, permission_type=None):
     """
     Custom permission check for Equipment doctype
@@ -17,10 +32,7 @@ def equipment_permission(doc, user=None, permission_type=None):
         return True
     
     # Check for admin roles for write operations
-    user_roles = frappe.get_roles(user)
-    admin_roles = ["System Manager", "ScooterBug Admin", "Administrator"]
-    
-    return bool(set(user_roles) & set(admin_roles))
+    return not ADMIN_ROLES.isdisjoint(get_user_roles(user))
 
 def booking_permission(doc, user=None, permission_type=None):
     """
@@ -32,21 +44,21 @@ def booking_permission(doc, user=None, permission_type=None):
     if not user:
         user = frappe.session.user
     
-    user_roles = frappe.get_roles(user)
+    user_roles = get_user_roles(user)
     
     # System managers have full access
-    if "System Manager" in user_roles or "Administrator" in user_roles:
+    if not MANAGER_ROLES.isdisjoint(user_roles):
         return True
     
     # ScooterBug Admin and Staff can read/write all
-    if "ScooterBug Admin" in user_roles or "ScooterBug Staff" in user_roles:
+    if not STAFF_ROLES.isdisjoint(user_roles):
         if permission_type != "delete":
             return True
     
     # Regular users can only access their own bookings
     if permission_type == "read":
         if hasattr(doc, "customer_email"):
-            user_email = frappe.db.get_value("User", user, "email")
+            user_email = frappe.get_cached_value("User", user, "email")
             return doc.customer_email == user_email
     
     return False
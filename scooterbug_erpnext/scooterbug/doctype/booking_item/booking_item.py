@@ -6,3 +6,7 @@ from frappe.model.document import Document
 
 class BookingItem(Document):
     pass
+
+def on_doctype_update():
+    # Equipment conflict lookup in api.booking.get_available_equipment
+    frappe.db.add_index("Booking Item", ["equipment", "parent"])
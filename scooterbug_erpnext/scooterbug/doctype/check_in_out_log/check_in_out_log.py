@@ -6,3 +6,7 @@ from frappe.model.document import Document
 
 class CheckInOutLog(Document):
     pass
+
+def on_doctype_update():
+    # Returned-items check in api.checkinout.check_all_items_returned
+    frappe.db.add_index("Check In Out Log", ["booking", "log_type", "equipment"])
@@ -4,5 +4,32 @@
 import frappe
 from frappe.model.document import Document
 
+RATES_CACHE_KEY = "scooterbug_equipment_rates"
+RATE_FIELDS = ["name", "equipment_name", "daily_rate", "damage_waiver_rate"]
+
 class Equipment(Document):
-    pass
+    def on_update(self):
+        frappe.cache().hdel(RATES_CACHE_KEY, self.name)
+
+    def on_trash(self):
+        frappe.cache().hdel(RATES_CACHE_KEY, self.name)
+
+def get_equipment_rates(equipment_ids):
+    """Get pricing fields for the given equipment, keyed by name, using the cache where possible"""
+    cache = frappe.cache()
+    rates = {}
+    missing = []
+    
+    for name in set(equipment_ids):
+        cached = cache.hget(RATES_CACHE_KEY, name)
+        if cached:
+            rates[name] = frappe._dict(cached)
+        else:
+            missing.append(name)
+    
+    if missing:
+        for eq in frappe.get_all("Equipment", filters={"name": ["in", missing]}, fields=RATE_FIELDS):
+            cache.hset(RATES_CACHE_KEY, eq.name, dict(eq))
+            rates[eq.name] = eq
+    
+    return rates
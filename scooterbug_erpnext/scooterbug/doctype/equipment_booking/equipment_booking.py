@@ -6,3 +6,10 @@ from frappe.model.document import Document
 
 class EquipmentBooking(Document):
     pass
+
+def on_doctype_update():
+    # Equipment conflict lookup in api.booking.get_available_equipment
+    frappe.db.add_index("Equipment Booking", ["booking_status", "rental_start_date", "rental_end_date"])
+    # Scheduler tasks and pending check-in/out lists
+    frappe.db.add_index("Equipment Booking", ["delivery_date", "booking_status", "docstatus"])
+    frappe.db.add_index("Equipment Booking", ["booking_status", "pickup_date", "docstatus"])
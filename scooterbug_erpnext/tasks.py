@@ -2,7 +2,41 @@
 Scheduled tasks for ScooterBug ERPNext
 """
 import frappe
-from frappe.utils import nowdate, add_days, getdate
+from frappe.utils import nowdate, add_days, now_datetime
+from jinja2 import Environment
+from scooterbug_erpnext.api.checkinout import clear_pending_cache
+
+EMAIL_BATCH_SIZE = 50
+AVAILABILITY_SIGNATURE_KEY = "scooterbug_availability_signature"
+
+# Email bodies are compiled once at import and rendered per booking
+email_templates = Environment(autoescape=True)
+
+REMINDER_EMAIL_TEMPLATE = email_templates.from_string("""
+<p>Dear {{ customer_name }},</p>
+<p>This is a friendly reminder that your equipment rental is scheduled for delivery tomorrow.</p>
+{% for booking in bookings %}
+<p><strong>Booking Details:</strong></p>
+<ul>
+    <li>Booking ID: {{ booking.name }}</li>
+    <li>Delivery Date: {{ booking.delivery_date }}</li>
+    <li>Delivery Time: {{ booking.delivery_time or 'As scheduled' }}</li>
+</ul>
+{% endfor %}
+<p>If you have any questions, please call us at 1-800-726-8284.</p>
+<p>Thank you for choosing ScooterBug!</p>
+""")
+
+OVERDUE_EMAIL_TEMPLATE = email_templates.from_string("""
+<p>Dear {{ customer_name }},</p>
+<p>Your equipment rental is now overdue for return.</p>
+{% for booking in bookings %}
+<p><strong>Booking {{ booking.name }} - Original Return Date:</strong> {{ booking.pickup_date }}</p>
+{% endfor %}
+<p>Please arrange for equipment return as soon as possible to avoid additional charges.</p>
+<p>Contact us at 1-800-726-8284 if you need to extend your rental.</p>
+<p>Thank you,<br>ScooterBug Team</p>
+""")
 
 def send_booking_reminders():
     """Send reminders for upcoming bookings (1 day before delivery)"""
@@ -18,27 +52,23 @@ def send_booking_reminders():
         fields=["name", "customer_name", "customer_email", "delivery_date", "delivery_time"]
     )
     
-    for booking in bookings:
-        if booking.customer_email:
-            try:
-                frappe.sendmail(
-                    recipients=[booking.customer_email],
-                    subject=f"ScooterBug Booking Reminder - {booking.name}",
-                    message=f"""
-                    <p>Dear {booking.customer_name},</p>
-                    <p>This is a friendly reminder that your equipment rental is scheduled for delivery tomorrow.</p>
-                    <p><strong>Booking Details:</strong></p>
-                    <ul>
-                        <li>Booking ID: {booking.name}</li>
-                        <li>Delivery Date: {booking.delivery_date}</li>
-                        <li>Delivery Time: {booking.delivery_time or 'As scheduled'}</li>
-                    </ul>
-                    <p>If you have any questions, please call us at 1-800-726-8284.</p>
-                    <p>Thank you for choosing ScooterBug!</p>
-                    """
+    enqueue_email_batches("scooterbug_erpnext.tasks.send_reminder_emails", bookings)
+
+def send_reminder_emails(customers):
+    """Send one booking reminder email per customer for a batch of (email, bookings) pairs"""
+    for email, bookings in customers:
+        booking_ids = ", ".join(booking.name for booking in bookings)
+        try:
+            frappe.sendmail(
+                recipients=[email],
+                subject=f"ScooterBug Booking Reminder - {booking_ids}",
+                message=REMINDER_EMAIL_TEMPLATE.render(
+                    customer_name=bookings[0].customer_name,
+                    bookings=bookings
                 )
-            except Exception as e:
-                frappe.log_error(f"Failed to send reminder for {booking.name}: {str(e)}")
+            )
+        except Exception as e:
+            frappe.log_error(f"Failed to send reminder for {booking_ids}: {str(e)}")
 
 def check_overdue_returns():
     """Check for overdue equipment returns and send notifications"""
@@ -51,66 +81,93 @@ def check_overdue_returns():
             "booking_status": "In Progress",
             "docstatus": 1
         },
-        fields=["name", "customer_name", "customer_email", "pickup_date"]
+        fields=["name", "customer_name", "customer_email", "pickup_date", "location"]
     )
     
-    for booking in overdue_bookings:
-        # Update status to Overdue
-        frappe.db.set_value("Equipment Booking", booking.name, "booking_status", "Overdue")
-        
-        # Send notification email
-        if booking.customer_email:
-            try:
-                frappe.sendmail(
-                    recipients=[booking.customer_email],
-                    subject=f"ScooterBug - Equipment Return Overdue - {booking.name}",
-                    message=f"""
-                    <p>Dear {booking.customer_name},</p>
-                    <p>Your equipment rental is now overdue for return.</p>
-                    <p><strong>Original Return Date:</strong> {booking.pickup_date}</p>
-                    <p>Please arrange for equipment return as soon as possible to avoid additional charges.</p>
-                    <p>Contact us at 1-800-726-8284 if you need to extend your rental.</p>
-                    <p>Thank you,<br>ScooterBug Team</p>
-                    """
-                )
-            except Exception as e:
-                frappe.log_error(f"Failed to send overdue notice for {booking.name}: {str(e)}")
+    if not overdue_bookings:
+        return
+    
+    # Update status to Overdue
+    frappe.db.sql("""
+        UPDATE `tabEquipment Booking`
+        SET booking_status = 'Overdue', modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(bookings)s
+    """, {
+        "bookings": [booking.name for booking in overdue_bookings],
+        "modified": now_datetime(),
+        "user": frappe.session.user
+    })
+    clear_pending_cache(locations=[booking.location for booking in overdue_bookings])
+    
+    # Send notification emails
+    enqueue_email_batches("scooterbug_erpnext.tasks.send_overdue_emails", overdue_bookings)
     
     frappe.db.commit()
 
+def send_overdue_emails(customers):
+    """Send one overdue return email per customer for a batch of (email, bookings) pairs"""
+    for email, bookings in customers:
+        booking_ids = ", ".join(booking.name for booking in bookings)
+        try:
+            frappe.sendmail(
+                recipients=[email],
+                subject=f"ScooterBug - Equipment Return Overdue - {booking_ids}",
+                message=OVERDUE_EMAIL_TEMPLATE.render(
+                    customer_name=bookings[0].customer_name,
+                    bookings=bookings
+                )
+            )
+        except Exception as e:
+            frappe.log_error(f"Failed to send overdue notice for {booking_ids}: {str(e)}")
+
+def enqueue_email_batches(method, bookings):
+    """Enqueue background jobs sending one email per customer address, in batches"""
+    # Group bookings by address so a customer with several bookings gets a single email
+    by_email = {}
+    for booking in bookings:
+        if booking.customer_email:
+            by_email.setdefault(booking.customer_email, []).append(booking)
+    
+    customers = list(by_email.items())
+    for i in range(0, len(customers), EMAIL_BATCH_SIZE):
+        frappe.enqueue(
+            method,
+            queue="long",
+            enqueue_after_commit=True,
+            customers=customers[i:i + EMAIL_BATCH_SIZE]
+        )
+
 def update_equipment_availability():
     """Update equipment availability based on booking status"""
-    # Get all equipment that should be available (no active bookings)
-    active_booking_equipment = frappe.get_all(
-        "Booking Item",
-        filters={
-            "parent": ["in", frappe.get_all(
-                "Equipment Booking",
-                filters={
-                    "booking_status": ["in", ["Confirmed", "In Progress"]],
-                    "docstatus": 1
-                },
-                pluck="name"
-            ) or ["__none__"]]
-        },
-        pluck="equipment"
-    )
+    # Skip the sweep if no booking or equipment has changed since the last run
+    signature = get_availability_signature()
+    if signature == frappe.cache().get_value(AVAILABILITY_SIGNATURE_KEY):
+        return
     
-    # Update equipment that should be available
+    # Mark equipment on active bookings as rented and release rented equipment
+    # without one, in a single pass
     frappe.db.sql("""
-        UPDATE `tabEquipment`
-        SET status = 'Available', is_available = 1
-        WHERE status = 'Rented'
-        AND name NOT IN %(active_equipment)s
-    """, {"active_equipment": active_booking_equipment or ["__none__"]})
-    
-    # Update equipment that should be rented
-    if active_booking_equipment:
-        frappe.db.sql("""
-            UPDATE `tabEquipment`
-            SET status = 'Rented', is_available = 0
-            WHERE name IN %(active_equipment)s
-            AND status != 'Maintenance'
-        """, {"active_equipment": active_booking_equipment})
+        UPDATE `tabEquipment` e
+        LEFT JOIN (
+            SELECT DISTINCT bi.equipment
+            FROM `tabBooking Item` bi
+            JOIN `tabEquipment Booking` eb ON eb.name = bi.parent
+            WHERE bi.parenttype = 'Equipment Booking'
+            AND bi.equipment IS NOT NULL
+            AND eb.booking_status IN ('Confirmed', 'In Progress')
+            AND eb.docstatus = 1
+        ) active ON active.equipment = e.name
+        SET e.status = IF(active.equipment IS NULL, 'Available', 'Rented'),
+            e.is_available = IF(active.equipment IS NULL, 1, 0)
+        WHERE (active.equipment IS NULL AND e.status = 'Rented')
+        OR (active.equipment IS NOT NULL AND e.status != 'Maintenance')
+    """)
     
     frappe.db.commit()
+    frappe.cache().set_value(AVAILABILITY_SIGNATURE_KEY, signature)
+
+def get_availability_signature():
+    """Get the latest modified timestamps of bookings and equipment, as a change marker"""
+    # The sweep itself does not touch modified, so it does not invalidate its own signature
+    return "|".join(str(frappe.db.sql(f"SELECT MAX(modified) FROM `tab{doctype}`")[0][0])
+                    for doctype in ("Equipment Booking", "Equipment"))